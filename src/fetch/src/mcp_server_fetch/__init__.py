@@ -18,7 +18,13 @@ def main():
     parser.add_argument("--proxy-url", type=str, help="Proxy URL to use for requests")
 
     args = parser.parse_args()
-    asyncio.run(serve(args.user_agent, args.ignore_robots_txt, args.proxy_url))
+
+    # Use uvloop's faster event loop when the optional extra is installed
+    try:
+        from uvloop import run
+    except ImportError:
+        run = asyncio.run
+    run(serve(args.user_agent, args.ignore_robots_txt, args.proxy_url))
 
 
 if __name__ == "__main__":
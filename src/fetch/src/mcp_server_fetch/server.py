@@ -1,8 +1,24 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
 from typing import Annotated, Tuple
-from urllib.parse import urlparse, urlunparse
+from urllib.parse import urlsplit
 
 import markdownify
 import readabilipy.simple_json
+from bs4 import BeautifulSoup
+from httpx import (
+    AsyncBaseTransport,
+    AsyncClient,
+    AsyncHTTPTransport,
+    HTTPError,
+    Limits,
+    Request,
+    Response,
+    Timeout,
+)
 from mcp.shared.exceptions import McpError
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
@@ -18,11 +34,129 @@ from mcp.types import (
     INTERNAL_ERROR,
 )
 from protego import Protego
-from pydantic import BaseModel, Field, AnyUrl
+from pydantic import BaseModel, ConfigDict, Field, AnyUrl
 
 DEFAULT_USER_AGENT_AUTONOMOUS = "ModelContextProtocol/1.0 (Autonomous; +https://github.com/modelcontextprotocol/servers)"
 DEFAULT_USER_AGENT_MANUAL = "ModelContextProtocol/1.0 (User-Specified; +https://github.com/modelcontextprotocol/servers)"
 
+RAW_CONTENT_PREFIX = "Content type {content_type} cannot be simplified to markdown, but here is the raw content:\n"
+SIMPLIFY_FAILED_ERROR = "<error>Page failed to be simplified from HTML</error>"
+TRUNCATED_RESPONSE_NOTICE = "<error>The page is larger than {max_bytes} bytes, so only its beginning was read and the rest is missing.</error>\n"
+
+DEFAULT_MAX_LENGTH = 5000
+DEFAULT_START_INDEX = 0
+DEFAULT_RAW = False
+
+# Stateless, so one converter is shared by all extractions
+_markdown_converter = markdownify.MarkdownConverter(heading_style=markdownify.ATX)
+
+HTML_MIME_TYPES = frozenset({"text/html", "application/xhtml+xml"})
+
+# Upper bound on how much of a response body is read; anything beyond is dropped
+MAX_RESPONSE_BYTES = 10 * 1024 * 1024
+
+CLIENT_LIMITS = Limits(max_connections=100, max_keepalive_connections=20)
+CLIENT_TIMEOUT = Timeout(30, connect=10)
+# Well below httpx's default of 20, so a redirect loop or long chain fails after a few round trips
+MAX_REDIRECTS = 5
+REDIRECT_CACHE_TTL = 3600
+REDIRECT_CACHE_MAXSIZE = 1024
+
+# Elements whose contents are never page text, plus HTML comments. Their contents are raw
+# text, so they can't nest and a non-greedy match removes them exactly. <template> can nest,
+# so it and structural tags like <nav> are left to readability. The lookahead after the name
+# keeps custom elements such as <style-guide> from matching. As in the HTML spec, an unclosed
+# tag, element or comment runs to the end of the document; matching it there in one go keeps
+# pages full of unclosed openers from making the substitution quadratic.
+_NON_CONTENT_RE = re.compile(
+    r"<(script|style|noscript)(?=[\s/>])[^>]*(?:>.*?(?:</\1\s*>|\Z)|\Z)|<!--.*?(?:-->|\Z)",
+    re.IGNORECASE | re.DOTALL,
+)
+
+# Whole comment lines, including their line ending, so they can be dropped in one pass.
+# Lines may end in \n, \r\n or a bare \r, and ^ alone only knows about \n.
+_ROBOTS_COMMENT_RE = re.compile(r"(?:^|(?<=\r))[ \t]*#[^\r\n]*(?:\r\n|\r|\n)?", re.MULTILINE)
+
+# Like Google, only the first 500 KiB of a robots.txt file is read
+ROBOTS_TXT_MAX_BYTES = 500 * 1024
+
+ROBOTS_CACHE_TTL = 3600
+ROBOTS_CACHE_MAXSIZE = 1024
+# Only the start of robots.txt is kept for the error message, so cached entries stay small
+ROBOTS_TXT_QUOTE_MAX_CHARS = 16 * 1024
+
+# One connection pool per proxy setting, so keep-alive connections are reused across calls
+_transports: dict[str | None, AsyncHTTPTransport] = {}
+
+
+def _get_transport(proxy_url: str | None = None) -> AsyncHTTPTransport:
+    """Get the shared connection pool for the given proxy, creating it on first use."""
+    transport = _transports.get(proxy_url)
+    if transport is None:
+        transport = AsyncHTTPTransport(http2=True, limits=CLIENT_LIMITS, proxy=proxy_url)
+        _transports[proxy_url] = transport
+    return transport
+
+
+class _PooledTransport(AsyncBaseTransport):
+    """Sends requests through a shared connection pool that outlives the client using it."""
+
+    def __init__(self, pool: AsyncHTTPTransport) -> None:
+        self._pool = pool
+
+    async def handle_async_request(self, request: Request) -> Response:
+        return await self._pool.handle_async_request(request)
+
+
+def _get_client(proxy_url: str | None = None) -> AsyncClient:
+    """Get a new HTTP client for a single fetch, backed by the shared connection pool.
+
+    Each fetch gets its own client, and so its own cookie jar: cookies set during a
+    fetch's redirect chain are kept for that chain but never reach unrelated fetches.
+    Closing the client leaves the shared pool open.
+
+    Args:
+        proxy_url: Optional proxy URL the client should route requests through
+
+    Returns:
+        An AsyncClient to be used as an async context manager for one fetch
+    """
+    return AsyncClient(
+        transport=_PooledTransport(_get_transport(proxy_url)),
+        timeout=CLIENT_TIMEOUT,
+        max_redirects=MAX_REDIRECTS,
+    )
+
+
+async def close_transports() -> None:
+    """Close all shared connection pools."""
+    while _transports:
+        _, transport = _transports.popitem()
+        await transport.aclose()
+
+
+# Parsed robots.txt per robots.txt URL (i.e. per origin), as (expiry, parser, start of the raw text).
+# A parser of None means the site has no robots.txt and everything may be fetched.
+# Locks only exist for origins being fetched or in the cache.
+_robots_cache: OrderedDict[str, tuple[float, Protego | None, str]] = OrderedDict()
+_robots_locks: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+
+def clear_robots_cache() -> None:
+    """Forget all cached robots.txt files."""
+    _robots_cache.clear()
+    _robots_locks.clear()
+
+
+# Expiry and final location of URLs that only answered with permanent (301/308) redirects,
+# oldest first
+_permanent_redirects: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+
+def clear_redirect_cache() -> None:
+    """Forget all cached permanent redirects."""
+    _permanent_redirects.clear()
+
 
 def extract_content_from_html(html: str) -> str:
     """Extract and convert HTML content to Markdown format.
@@ -33,18 +167,25 @@ def extract_content_from_html(html: str) -> str:
     Returns:
         Simplified markdown version of the content
     """
+    # Nothing to simplify, so don't start readability (and possibly node) at all
+    if not html or html.isspace():
+        return SIMPLIFY_FAILED_ERROR
+    # Drop scripts, styles and comments up front so readability has less to parse and score
+    html = _NON_CONTENT_RE.sub("", html)
     ret = readabilipy.simple_json.simple_json_from_html_string(
         html, use_readability=True
     )
     if not ret["content"]:
-        return "<error>Page failed to be simplified from HTML</error>"
-    content = markdownify.markdownify(
-        ret["content"],
-        heading_style=markdownify.ATX,
-    )
+        return SIMPLIFY_FAILED_ERROR
+    # Parse the simplified article once with lxml and convert that tree directly
+    soup = BeautifulSoup(ret["content"], "lxml")
+    content = _markdown_converter.convert_soup(soup)
+    if not content.strip():
+        return SIMPLIFY_FAILED_ERROR
     return content
 
 
+@lru_cache(maxsize=4096)
 def get_robots_txt_url(url: str) -> str:
     """Get the robots.txt URL for a given website URL.
 
@@ -54,13 +195,89 @@ def get_robots_txt_url(url: str) -> str:
     Returns:
         URL of the robots.txt file
     """
-    # Parse the URL into components
-    parsed = urlparse(url)
+    # Keep just the scheme and netloc; urlsplit skips the ;params handling urlparse does
+    parsed = urlsplit(url)
+    return f"{parsed.scheme}://{parsed.netloc}/robots.txt"
 
-    # Reconstruct the base URL with just scheme, netloc, and /robots.txt path
-    robots_url = urlunparse((parsed.scheme, parsed.netloc, "/robots.txt", "", "", ""))
 
-    return robots_url
+async def _fetch_robots_txt(
+    robot_txt_url: str, user_agent: str, proxy_url: str | None = None
+) -> tuple[Protego | None, str, int]:
+    """Fetch and parse a robots.txt file.
+
+    Returns the parser, the start of the raw robots.txt text and the response status code.
+    The parser is None and the text empty if the site has no robots.txt.
+    Raises a McpError if robots.txt cannot be fetched or requires authorization.
+    """
+    try:
+        async with _get_client(proxy_url) as client, client.stream(
+            "GET",
+            robot_txt_url,
+            follow_redirects=True,
+            headers={"User-Agent": user_agent},
+        ) as response:
+            if response.status_code in (401, 403):
+                raise McpError(ErrorData(
+                    code=INTERNAL_ERROR,
+                    message=f"When fetching robots.txt ({robot_txt_url}), received status {response.status_code} so assuming that autonomous fetching is not allowed, the user can try manually fetching by using the fetch prompt",
+                ))
+            elif 400 <= response.status_code < 500:
+                return None, "", response.status_code
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body.extend(chunk)
+                if len(body) >= ROBOTS_TXT_MAX_BYTES:
+                    break
+    except HTTPError:
+        raise McpError(ErrorData(
+            code=INTERNAL_ERROR,
+            message=f"Failed to fetch robots.txt {robot_txt_url} due to a connection issue",
+        ))
+    if len(body) >= ROBOTS_TXT_MAX_BYTES:
+        # Drop the line the cap cut through, so a truncated rule can't turn into a broader one
+        last_line_end = max(
+            body.rfind(b"\n", 0, ROBOTS_TXT_MAX_BYTES), body.rfind(b"\r", 0, ROBOTS_TXT_MAX_BYTES)
+        )
+        del body[last_line_end + 1:]
+    robot_txt = body.decode(response.encoding or "utf-8", errors="replace")
+    processed_robot_txt = _ROBOTS_COMMENT_RE.sub("", robot_txt)
+    return (
+        Protego.parse(processed_robot_txt),
+        robot_txt[:ROBOTS_TXT_QUOTE_MAX_CHARS],
+        response.status_code,
+    )
+
+
+async def _get_robots_txt(
+    robot_txt_url: str, user_agent: str, proxy_url: str | None = None
+) -> tuple[Protego | None, str]:
+    """Get the parsed robots.txt for an origin, fetching it only when not cached or expired."""
+    async with _robots_locks[robot_txt_url]:
+        now = time.monotonic()
+        cached = _robots_cache.get(robot_txt_url)
+        if cached is not None and cached[0] > now:
+            _robots_cache.move_to_end(robot_txt_url)
+            return cached[1], cached[2]
+
+        cacheable = False
+        try:
+            robot_parser, robot_txt, status_code = await _fetch_robots_txt(
+                robot_txt_url, user_agent, proxy_url
+            )
+            # A server error page says nothing lasting about the rules, so check again next time
+            cacheable = status_code < 500
+        finally:
+            # Only cached origins keep their lock, so failed fetches don't leave locks behind
+            if not cacheable and robot_txt_url not in _robots_cache:
+                _robots_locks.pop(robot_txt_url, None)
+
+        if cacheable:
+            _robots_cache[robot_txt_url] = (now + ROBOTS_CACHE_TTL, robot_parser, robot_txt)
+            _robots_cache.move_to_end(robot_txt_url)
+            while len(_robots_cache) > ROBOTS_CACHE_MAXSIZE:
+                evicted_url, _ = _robots_cache.popitem(last=False)
+                _robots_locks.pop(evicted_url, None)
+        return robot_parser, robot_txt
 
 
 async def check_may_autonomously_fetch_url(url: str, user_agent: str, proxy_url: str | None = None) -> None:
@@ -68,34 +285,11 @@ async def check_may_autonomously_fetch_url(url: str, user_agent: str, proxy_url:
     Check if the URL can be fetched by the user agent according to the robots.txt file.
     Raises a McpError if not.
     """
-    from httpx import AsyncClient, HTTPError
-
     robot_txt_url = get_robots_txt_url(url)
 
-    async with AsyncClient(proxies=proxy_url) as client:
-        try:
-            response = await client.get(
-                robot_txt_url,
-                follow_redirects=True,
-                headers={"User-Agent": user_agent},
-            )
-        except HTTPError:
-            raise McpError(ErrorData(
-                code=INTERNAL_ERROR,
-                message=f"Failed to fetch robots.txt {robot_txt_url} due to a connection issue",
-            ))
-        if response.status_code in (401, 403):
-            raise McpError(ErrorData(
-                code=INTERNAL_ERROR,
-                message=f"When fetching robots.txt ({robot_txt_url}), received status {response.status_code} so assuming that autonomous fetching is not allowed, the user can try manually fetching by using the fetch prompt",
-            ))
-        elif 400 <= response.status_code < 500:
-            return
-        robot_txt = response.text
-    processed_robot_txt = "\n".join(
-        line for line in robot_txt.splitlines() if not line.strip().startswith("#")
-    )
-    robot_parser = Protego.parse(processed_robot_txt)
+    robot_parser, robot_txt = await _get_robots_txt(robot_txt_url, user_agent, proxy_url)
+    if robot_parser is None:
+        return
     if not robot_parser.can_fetch(str(url), user_agent):
         raise McpError(ErrorData(
             code=INTERNAL_ERROR,
@@ -108,54 +302,94 @@ async def check_may_autonomously_fetch_url(url: str, user_agent: str, proxy_url:
         ))
 
 
+async def _get_page(
+    url: str, request_url: str, user_agent: str, proxy_url: str | None
+) -> Tuple[Response, bytearray, bool]:
+    """
+    Request url at request_url and return the response, up to MAX_RESPONSE_BYTES of its body
+    and whether the body was cut short.
+    """
+    try:
+        async with _get_client(proxy_url) as client, client.stream(
+            "GET",
+            request_url,
+            follow_redirects=True,
+            headers={"User-Agent": user_agent},
+            timeout=30,
+        ) as response:
+            if response.status_code >= 400:
+                raise McpError(ErrorData(
+                    code=INTERNAL_ERROR,
+                    message=f"Failed to fetch {url} - status code {response.status_code}",
+                ))
+            # Go straight to the final location next time if every hop was permanent
+            if response.history and all(r.status_code in (301, 308) for r in response.history):
+                expires = time.monotonic() + REDIRECT_CACHE_TTL
+                _permanent_redirects[url] = (expires, str(response.url))
+                _permanent_redirects.move_to_end(url)
+                while len(_permanent_redirects) > REDIRECT_CACHE_MAXSIZE:
+                    _permanent_redirects.popitem(last=False)
+            # Accumulate the raw bytes and decode once, instead of buffering then copying into .text
+            body = bytearray()
+            truncated = False
+            async for chunk in response.aiter_bytes():
+                body.extend(chunk)
+                if len(body) >= MAX_RESPONSE_BYTES:
+                    truncated = True
+                    break
+    except HTTPError as e:
+        raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to fetch {url}: {e!r}"))
+
+    return response, body, truncated
+
+
 async def fetch_url(
     url: str, user_agent: str, force_raw: bool = False, proxy_url: str | None = None
 ) -> Tuple[str, str]:
     """
     Fetch the URL and return the content in a form ready for the LLM, as well as a prefix string with status information.
     """
-    from httpx import AsyncClient, HTTPError
-
-    async with AsyncClient(proxies=proxy_url) as client:
+    cached = _permanent_redirects.get(url)
+    if cached is not None and cached[0] > time.monotonic():
         try:
-            response = await client.get(
-                url,
-                follow_redirects=True,
-                headers={"User-Agent": user_agent},
-                timeout=30,
-            )
-        except HTTPError as e:
-            raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to fetch {url}: {e!r}"))
-        if response.status_code >= 400:
-            raise McpError(ErrorData(
-                code=INTERNAL_ERROR,
-                message=f"Failed to fetch {url} - status code {response.status_code}",
-            ))
+            response, body, truncated = await _get_page(url, cached[1], user_agent, proxy_url)
+        except McpError:
+            # The remembered location stopped working, so forget it and start over from the URL
+            _permanent_redirects.pop(url, None)
+            response, body, truncated = await _get_page(url, url, user_agent, proxy_url)
+    else:
+        response, body, truncated = await _get_page(url, url, user_agent, proxy_url)
 
-        page_raw = response.text
+    page_raw = body.decode(response.encoding or "utf-8", errors="replace")
 
     content_type = response.headers.get("content-type", "")
+    mime_type = content_type.split(";", 1)[0].strip().lower()
     is_page_html = (
-        "<html" in page_raw[:100] or "text/html" in content_type or not content_type
+        "<html" in page_raw[:100] or mime_type in HTML_MIME_TYPES or not content_type
     )
 
     if is_page_html and not force_raw:
-        return extract_content_from_html(page_raw), ""
+        content, prefix = extract_content_from_html(page_raw), ""
+    else:
+        content, prefix = page_raw, RAW_CONTENT_PREFIX.format(content_type=content_type)
 
-    return (
-        page_raw,
-        f"Content type {content_type} cannot be simplified to markdown, but here is the raw content:\n",
-    )
+    # Say so when the cap cut the page short, otherwise callers would take it as the whole page
+    if truncated:
+        prefix = TRUNCATED_RESPONSE_NOTICE.format(max_bytes=MAX_RESPONSE_BYTES) + prefix
+    return content, prefix
 
 
 class Fetch(BaseModel):
     """Parameters for fetching a URL."""
 
+    # Frozen so cached instances can be shared safely between calls
+    model_config = ConfigDict(frozen=True)
+
     url: Annotated[AnyUrl, Field(description="URL to fetch")]
     max_length: Annotated[
         int,
         Field(
-            default=5000,
+            default=DEFAULT_MAX_LENGTH,
             description="Maximum number of characters to return.",
             gt=0,
             lt=1000000,
@@ -164,7 +398,7 @@ class Fetch(BaseModel):
     start_index: Annotated[
         int,
         Field(
-            default=0,
+            default=DEFAULT_START_INDEX,
             description="On return output starting at this character index, useful if a previous fetch was truncated and more context is required.",
             ge=0,
         ),
@@ -172,11 +406,25 @@ class Fetch(BaseModel):
     raw: Annotated[
         bool,
         Field(
-            default=False,
+            default=DEFAULT_RAW,
             description="Get the actual HTML content of the requested page, without simplification.",
         ),
     ]
 
+    @classmethod
+    @lru_cache(maxsize=1024)
+    def _cached(
+        cls,
+        url: str,
+        max_length: int = DEFAULT_MAX_LENGTH,
+        start_index: int = DEFAULT_START_INDEX,
+        raw: bool = DEFAULT_RAW,
+    ) -> "Fetch":
+        """Validate the parameters, reusing the instance for repeated identical calls."""
+        return cls.model_validate(
+            {"url": url, "max_length": max_length, "start_index": start_index, "raw": raw}
+        )
+
 
 async def serve(
     custom_user_agent: str | None = None,
@@ -223,7 +471,11 @@ Although originally you did not have internet access, and were advised to refuse
     @server.call_tool()
     async def call_tool(name, arguments: dict) -> list[TextContent]:
         try:
-            args = Fetch(**arguments)
+            try:
+                args = Fetch._cached(**arguments)
+            except TypeError:
+                # Unexpected or unhashable arguments, validate without the cache
+                args = Fetch(**arguments)
         except ValueError as e:
             raise McpError(ErrorData(code=INVALID_PARAMS, message=str(e)))
 
@@ -284,5 +536,8 @@ Although originally you did not have internet access, and were advised to refuse
         )
 
     options = server.create_initialization_options()
-    async with stdio_server() as (read_stream, write_stream):
-        await server.run(read_stream, write_stream, options, raise_exceptions=True)
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await server.run(read_stream, write_stream, options, raise_exceptions=True)
+    finally:
+        await close_transports()
@@ -0,0 +1,50 @@
+from typing import Callable
+
+import httpx
+import pytest
+
+from mcp_server_fetch.server import clear_redirect_cache, clear_robots_cache
+
+
+@pytest.fixture(autouse=True)
+def _empty_caches():
+    """Start every test without robots.txt files or redirects cached by earlier tests."""
+    clear_robots_cache()
+    clear_redirect_cache()
+    yield
+    clear_robots_cache()
+    clear_redirect_cache()
+
+
+class MockServer:
+    """Answers the fetch server's HTTP requests with canned responses and records them."""
+
+    def __init__(self) -> None:
+        self.requests: list[httpx.Request] = []
+        self.proxy_urls: list[str | None] = []
+        self._handler: Callable[[httpx.Request], httpx.Response] = lambda request: httpx.Response(404)
+
+    def respond(self, status_code: int = 200, text: str = "", headers: dict[str, str] | None = None) -> None:
+        """Answer every request with the given response."""
+        self._handler = lambda request: httpx.Response(status_code, text=text, headers=headers)
+
+    def route(self, handler: Callable[[httpx.Request], httpx.Response]) -> None:
+        """Answer requests with a custom handler, e.g. to serve several URLs or raise errors."""
+        self._handler = handler
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        return self._handler(request)
+
+
+@pytest.fixture
+def mock_server(monkeypatch):
+    """Route the server's HTTP clients through an httpx.MockTransport."""
+    server = MockServer()
+
+    def get_client(proxy_url: str | None = None) -> httpx.AsyncClient:
+        server.proxy_urls.append(proxy_url)
+        return httpx.AsyncClient(transport=httpx.MockTransport(server))
+
+    monkeypatch.setattr("mcp_server_fetch.server._get_client", get_client)
+    return server
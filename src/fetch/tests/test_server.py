@@ -2,10 +2,12 @@
 Comprehensive unit tests for the MCP Fetch Server.
 Tests cover happy paths, edge cases, and failure conditions.
 """
+import httpx
 import pytest
-from unittest.mock import AsyncMock, Mock, patch, MagicMock
+from httpx import ConnectError, TimeoutException
+from unittest.mock import patch
 from mcp.shared.exceptions import McpError
-from mcp.types import INVALID_PARAMS, INTERNAL_ERROR
+from mcp.types import INTERNAL_ERROR
 
 from mcp_server_fetch.server import (
     extract_content_from_html,
@@ -13,11 +15,58 @@ from mcp_server_fetch.server import (
     check_may_autonomously_fetch_url,
     fetch_url,
     Fetch,
+    _get_client,
+    _get_transport,
+    close_transports,
     DEFAULT_USER_AGENT_AUTONOMOUS,
     DEFAULT_USER_AGENT_MANUAL,
+    MAX_REDIRECTS,
+    ROBOTS_TXT_QUOTE_MAX_CHARS,
+    TRUNCATED_RESPONSE_NOTICE,
+    _robots_locks,
 )
 
 
+class ClosableMockTransport(httpx.MockTransport):
+    """A MockTransport that records whether it was closed."""
+
+    closed = False
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+
+ROBOTS_ALLOW_ALL_BUT_ADMIN = """
+User-agent: *
+Disallow: /admin/
+Allow: /
+"""
+ROBOTS_DENY_ALL = """
+User-agent: *
+Disallow: /
+"""
+ROBOTS_WITH_COMMENTS = """
+# This is a comment
+User-agent: *
+# Another comment
+Disallow: /admin/
+Allow: /
+"""
+ROBOTS_DENY_BADBOT_ONLY = """
+User-agent: BadBot
+Disallow: /
+
+User-agent: *
+Allow: /
+"""
+
+
+@pytest.fixture(scope="session")
+def large_html():
+    """A single ~100 KB HTML document shared by the large-input tests."""
+    return "<html><body>" + ("p" * 100000) + "</body></html>"
+
+
 class TestExtractContentFromHtml:
     """Test HTML content extraction and markdown conversion."""
 
@@ -111,59 +160,42 @@ class TestExtractContentFromHtml:
         assert len(result) > 0
 
 
-class TestGetRobotsTxtUrl:
-    """Test robots.txt URL generation."""
-
-    def test_simple_http_url(self):
-        """Test robots.txt URL for simple HTTP URL."""
-        url = "http://example.com/page"
-        result = get_robots_txt_url(url)
-        
-        assert result == "http://example.com/robots.txt"
-
-    def test_simple_https_url(self):
-        """Test robots.txt URL for HTTPS URL."""
-        url = "https://example.com/page"
-        result = get_robots_txt_url(url)
-        
-        assert result == "https://example.com/robots.txt"
-
-    def test_url_with_path(self):
-        """Test robots.txt URL for URL with complex path."""
-        url = "https://example.com/path/to/page.html"
-        result = get_robots_txt_url(url)
-        
-        assert result == "https://example.com/robots.txt"
+    def test_extract_uses_atx_headings(self):
+        """Test headings are converted to ATX-style markdown."""
+        html = """
+        <html>
+            <body>
+                <article>
+                    <h2>Section Heading</h2>
+                    <p>Some paragraph text that belongs to the section.</p>
+                </article>
+            </body>
+        </html>
+        """
+        result = extract_content_from_html(html)
 
-    def test_url_with_query_params(self):
-        """Test robots.txt URL strips query parameters."""
-        url = "https://example.com/page?param=value&foo=bar"
-        result = get_robots_txt_url(url)
-        
-        assert result == "https://example.com/robots.txt"
-        assert "?" not in result
+        assert "## Section Heading" in result
 
-    def test_url_with_fragment(self):
-        """Test robots.txt URL strips fragments."""
-        url = "https://example.com/page#section"
-        result = get_robots_txt_url(url)
-        
-        assert result == "https://example.com/robots.txt"
-        assert "#" not in result
 
-    def test_url_with_port(self):
-        """Test robots.txt URL preserves port."""
-        url = "https://example.com:8080/page"
-        result = get_robots_txt_url(url)
-        
-        assert result == "https://example.com:8080/robots.txt"
+class TestGetRobotsTxtUrl:
+    """Test robots.txt URL generation."""
 
-    def test_url_with_subdomain(self):
-        """Test robots.txt URL with subdomain."""
-        url = "https://api.example.com/endpoint"
-        result = get_robots_txt_url(url)
-        
-        assert result == "https://api.example.com/robots.txt"
+    @pytest.mark.parametrize(
+        "url,expected",
+        [
+            ("http://example.com/page", "http://example.com/robots.txt"),
+            ("https://example.com/page", "https://example.com/robots.txt"),
+            ("https://example.com/path/to/page.html", "https://example.com/robots.txt"),
+            ("https://example.com/page?param=value&foo=bar", "https://example.com/robots.txt"),
+            ("https://example.com/page#section", "https://example.com/robots.txt"),
+            ("https://example.com:8080/page", "https://example.com:8080/robots.txt"),
+            ("https://api.example.com/endpoint", "https://api.example.com/robots.txt"),
+        ],
+        ids=["http", "https", "path", "query_params", "fragment", "port", "subdomain"],
+    )
+    def test_robots_txt_url(self, url, expected):
+        """Test robots.txt URL keeps scheme, host and port and drops the rest."""
+        assert get_robots_txt_url(url) == expected
 
     def test_url_with_auth(self):
         """Test robots.txt URL with authentication."""
@@ -174,406 +206,638 @@ class TestGetRobotsTxtUrl:
         assert "robots.txt" in result
 
 
-@pytest.mark.asyncio
+@pytest.mark.asyncio(loop_scope="session")
 class TestCheckMayAutonomouslyFetchUrl:
     """Test robots.txt checking functionality."""
 
-    async def test_robots_txt_allows_fetch(self):
+    async def test_robots_txt_allows_fetch(self, mock_server):
         """Test when robots.txt allows fetching."""
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = """
-User-agent: *
-Disallow: /admin/
-Allow: /
-"""
-        
-        with patch('mcp_server_fetch.server.AsyncClient') as mock_client:
-            mock_client.return_value.__aenter__.return_value.get = AsyncMock(return_value=mock_response)
-            
-            # Should not raise an exception
+        mock_server.respond(200, ROBOTS_ALLOW_ALL_BUT_ADMIN)
+
+        # Should not raise an exception
+        await check_may_autonomously_fetch_url(
+            "https://example.com/page",
+            DEFAULT_USER_AGENT_AUTONOMOUS
+        )
+
+        assert str(mock_server.requests[0].url) == "https://example.com/robots.txt"
+
+    async def test_robots_txt_disallows_fetch(self, mock_server):
+        """Test when robots.txt disallows fetching."""
+        mock_server.respond(200, ROBOTS_DENY_ALL)
+
+        with pytest.raises(McpError) as exc_info:
             await check_may_autonomously_fetch_url(
                 "https://example.com/page",
                 DEFAULT_USER_AGENT_AUTONOMOUS
             )
 
-    async def test_robots_txt_disallows_fetch(self):
-        """Test when robots.txt disallows fetching."""
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = """
-User-agent: *
-Disallow: /
-"""
-        
-        with patch('mcp_server_fetch.server.AsyncClient') as mock_client:
-            mock_client.return_value.__aenter__.return_value.get = AsyncMock(return_value=mock_response)
-            
-            with pytest.raises(McpError) as exc_info:
-                await check_may_autonomously_fetch_url(
-                    "https://example.com/page",
-                    DEFAULT_USER_AGENT_AUTONOMOUS
-                )
-            
-            assert exc_info.value.error.code == INTERNAL_ERROR
+        assert exc_info.value.error.code == INTERNAL_ERROR
 
-    async def test_robots_txt_404(self):
+    async def test_robots_txt_404(self, mock_server):
         """Test when robots.txt returns 404 (should allow)."""
-        mock_response = Mock()
-        mock_response.status_code = 404
-        
-        with patch('mcp_server_fetch.server.AsyncClient') as mock_client:
-            mock_client.return_value.__aenter__.return_value.get = AsyncMock(return_value=mock_response)
-            
-            # Should not raise (404 means no restrictions)
+        mock_server.respond(404)
+
+        # Should not raise (404 means no restrictions)
+        await check_may_autonomously_fetch_url(
+            "https://example.com/page",
+            DEFAULT_USER_AGENT_AUTONOMOUS
+        )
+
+    async def test_robots_txt_401_forbidden(self, mock_server):
+        """Test when robots.txt returns 401."""
+        mock_server.respond(401)
+
+        with pytest.raises(McpError) as exc_info:
             await check_may_autonomously_fetch_url(
                 "https://example.com/page",
                 DEFAULT_USER_AGENT_AUTONOMOUS
             )
 
-    async def test_robots_txt_401_forbidden(self):
-        """Test when robots.txt returns 401."""
-        mock_response = Mock()
-        mock_response.status_code = 401
-        
-        with patch('mcp_server_fetch.server.AsyncClient') as mock_client:
-            mock_client.return_value.__aenter__.return_value.get = AsyncMock(return_value=mock_response)
-            
-            with pytest.raises(McpError) as exc_info:
-                await check_may_autonomously_fetch_url(
-                    "https://example.com/page",
-                    DEFAULT_USER_AGENT_AUTONOMOUS
-                )
-            
-            assert exc_info.value.error.code == INTERNAL_ERROR
-            assert "401" in exc_info.value.error.message
+        assert exc_info.value.error.code == INTERNAL_ERROR
+        assert "401" in exc_info.value.error.message
 
-    async def test_robots_txt_403_forbidden(self):
+    async def test_robots_txt_403_forbidden(self, mock_server):
         """Test when robots.txt returns 403."""
-        mock_response = Mock()
-        mock_response.status_code = 403
-        
-        with patch('mcp_server_fetch.server.AsyncClient') as mock_client:
-            mock_client.return_value.__aenter__.return_value.get = AsyncMock(return_value=mock_response)
-            
-            with pytest.raises(McpError) as exc_info:
-                await check_may_autonomously_fetch_url(
-                    "https://example.com/page",
-                    DEFAULT_USER_AGENT_AUTONOMOUS
-                )
-            
-            assert exc_info.value.error.code == INTERNAL_ERROR
-            assert "403" in exc_info.value.error.message
+        mock_server.respond(403)
+
+        with pytest.raises(McpError) as exc_info:
+            await check_may_autonomously_fetch_url(
+                "https://example.com/page",
+                DEFAULT_USER_AGENT_AUTONOMOUS
+            )
+
+        assert exc_info.value.error.code == INTERNAL_ERROR
+        assert "403" in exc_info.value.error.message
 
-    async def test_robots_txt_connection_error(self):
+    async def test_robots_txt_connection_error(self, mock_server):
         """Test when fetching robots.txt fails with connection error."""
-        from httpx import ConnectError
-        
-        with patch('mcp_server_fetch.server.AsyncClient') as mock_client:
-            mock_client.return_value.__aenter__.return_value.get = AsyncMock(
-                side_effect=ConnectError("Connection failed")
+        def refuse(request):
+            raise ConnectError("Connection failed", request=request)
+
+        mock_server.route(refuse)
+
+        with pytest.raises(McpError) as exc_info:
+            await check_may_autonomously_fetch_url(
+                "https://example.com/page",
+                DEFAULT_USER_AGENT_AUTONOMOUS
+            )
+
+        assert exc_info.value.error.code == INTERNAL_ERROR
+        assert "connection issue" in exc_info.value.error.message.lower()
+
+    async def test_robots_txt_with_comments(self, mock_server):
+        """Test robots.txt parsing with comments."""
+        mock_server.respond(200, ROBOTS_WITH_COMMENTS)
+
+        # Should not raise an exception
+        await check_may_autonomously_fetch_url(
+            "https://example.com/page",
+            DEFAULT_USER_AGENT_AUTONOMOUS
+        )
+
+    async def test_robots_txt_with_comments_and_cr_line_endings(self, mock_server):
+        """Test a leading comment doesn't hide the rules of a robots.txt using bare CR line endings."""
+        mock_server.respond(200, "# A comment\rUser-agent: *\rDisallow: /\r")
+
+        with pytest.raises(McpError):
+            await check_may_autonomously_fetch_url(
+                "https://example.com/page",
+                DEFAULT_USER_AGENT_AUTONOMOUS
+            )
+
+    async def test_robots_txt_specific_user_agent(self, mock_server):
+        """Test robots.txt with specific user agent rules."""
+        mock_server.respond(200, ROBOTS_DENY_BADBOT_ONLY)
+
+        # Should not raise for our user agent
+        await check_may_autonomously_fetch_url(
+            "https://example.com/page",
+            DEFAULT_USER_AGENT_AUTONOMOUS
+        )
+
+    async def test_robots_txt_with_proxy(self, mock_server):
+        """Test robots.txt check with proxy configuration."""
+        mock_server.respond(200, "User-agent: *\nAllow: /")
+
+        await check_may_autonomously_fetch_url(
+            "https://example.com/page",
+            DEFAULT_USER_AGENT_AUTONOMOUS,
+            proxy_url="http://proxy.example.com:8080"
+        )
+
+        # Verify proxy was passed to client
+        assert mock_server.proxy_urls == ["http://proxy.example.com:8080"]
+
+    async def test_robots_txt_cached_between_calls(self, mock_server):
+        """Test robots.txt is fetched once per origin and then served from cache."""
+        mock_server.respond(200, "User-agent: *\nDisallow: /admin/")
+
+        await check_may_autonomously_fetch_url(
+            "https://example.com/page",
+            DEFAULT_USER_AGENT_AUTONOMOUS
+        )
+        with pytest.raises(McpError):
+            await check_may_autonomously_fetch_url(
+                "https://example.com/admin/panel",
+                DEFAULT_USER_AGENT_AUTONOMOUS
+            )
+
+        assert len(mock_server.requests) == 1
+
+    async def test_robots_txt_cache_expires(self, mock_server, monkeypatch):
+        """Test robots.txt is fetched again once the cached copy expires."""
+        mock_server.respond(404)
+        monkeypatch.setattr('mcp_server_fetch.server.ROBOTS_CACHE_TTL', 0)
+
+        for _ in range(2):
+            await check_may_autonomously_fetch_url(
+                "https://example.com/page",
+                DEFAULT_USER_AGENT_AUTONOMOUS
             )
-            
-            with pytest.raises(McpError) as exc_info:
+
+        assert len(mock_server.requests) == 2
+
+    async def test_robots_txt_errors_not_cached(self, mock_server):
+        """Test a failed robots.txt fetch is retried on the next check."""
+        mock_server.respond(403)
+
+        for _ in range(2):
+            with pytest.raises(McpError):
                 await check_may_autonomously_fetch_url(
                     "https://example.com/page",
                     DEFAULT_USER_AGENT_AUTONOMOUS
                 )
-            
-            assert exc_info.value.error.code == INTERNAL_ERROR
-            assert "connection issue" in exc_info.value.error.message.lower()
 
-    async def test_robots_txt_with_comments(self):
-        """Test robots.txt parsing with comments."""
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = """
-# This is a comment
-User-agent: *
-# Another comment
-Disallow: /admin/
-Allow: /
-"""
-        
-        with patch('mcp_server_fetch.server.AsyncClient') as mock_client:
-            mock_client.return_value.__aenter__.return_value.get = AsyncMock(return_value=mock_response)
-            
-            # Should not raise an exception
+        assert len(mock_server.requests) == 2
+        assert not _robots_locks
+
+    async def test_robots_txt_server_error_not_cached(self, mock_server):
+        """Test a robots.txt server error page isn't cached in place of the real rules."""
+        mock_server.respond(503, "<html><body>Service unavailable</body></html>")
+
+        for _ in range(2):
             await check_may_autonomously_fetch_url(
                 "https://example.com/page",
                 DEFAULT_USER_AGENT_AUTONOMOUS
             )
 
-    async def test_robots_txt_specific_user_agent(self):
-        """Test robots.txt with specific user agent rules."""
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = """
-User-agent: BadBot
-Disallow: /
+        assert len(mock_server.requests) == 2
+        assert not _robots_locks
 
-User-agent: *
-Allow: /
-"""
-        
-        with patch('mcp_server_fetch.server.AsyncClient') as mock_client:
-            mock_client.return_value.__aenter__.return_value.get = AsyncMock(return_value=mock_response)
-            
-            # Should not raise for our user agent
+    async def test_robots_txt_quote_capped(self, mock_server):
+        """Test only the start of a large robots.txt is kept for the error message."""
+        mock_server.respond(200, ROBOTS_DENY_ALL + "# padding\n" * 10000)
+
+        with pytest.raises(McpError) as exc_info:
             await check_may_autonomously_fetch_url(
                 "https://example.com/page",
                 DEFAULT_USER_AGENT_AUTONOMOUS
             )
 
-    async def test_robots_txt_with_proxy(self):
-        """Test robots.txt check with proxy configuration."""
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = "User-agent: *\nAllow: /"
-        
-        with patch('mcp_server_fetch.server.AsyncClient') as mock_client:
-            mock_instance = mock_client.return_value.__aenter__.return_value
-            mock_instance.get = AsyncMock(return_value=mock_response)
-            
+        message = exc_info.value.error.message
+        assert "Disallow: /" in message
+        assert len(message) < ROBOTS_TXT_QUOTE_MAX_CHARS + 1000
+
+    async def test_robots_txt_size_capped(self, mock_server, monkeypatch):
+        """Test only the first ROBOTS_TXT_MAX_BYTES of robots.txt are read."""
+        monkeypatch.setattr('mcp_server_fetch.server.ROBOTS_TXT_MAX_BYTES', 40)
+        chunks_read = []
+
+        async def endless_robots_txt():
+            yield b"User-agent: *\nDisallow: /private/\n"
+            while True:
+                chunks_read.append(b"#")
+                yield b"# padding\n"
+
+        mock_server.route(lambda request: httpx.Response(200, content=endless_robots_txt()))
+
+        await check_may_autonomously_fetch_url(
+            "https://example.com/page",
+            DEFAULT_USER_AGENT_AUTONOMOUS
+        )
+        with pytest.raises(McpError):
             await check_may_autonomously_fetch_url(
-                "https://example.com/page",
-                DEFAULT_USER_AGENT_AUTONOMOUS,
-                proxy_url="http://proxy.example.com:8080"
+                "https://example.com/private/page",
+                DEFAULT_USER_AGENT_AUTONOMOUS
             )
-            
-            # Verify proxy was passed to client
-            mock_client.assert_called_with(proxies="http://proxy.example.com:8080")
+
+        assert len(chunks_read) == 1
+
+    async def test_robots_txt_size_cap_drops_partial_line(self, mock_server, monkeypatch):
+        """Test a rule cut off by the size cap is dropped rather than parsed as a shorter rule."""
+        # The cap falls right after "Disallow: /", which on its own would block the whole site
+        monkeypatch.setattr('mcp_server_fetch.server.ROBOTS_TXT_MAX_BYTES', 25)
+        mock_server.respond(200, "User-agent: *\nDisallow: /private/\n")
+
+        await check_may_autonomously_fetch_url(
+            "https://example.com/page",
+            DEFAULT_USER_AGENT_AUTONOMOUS
+        )
 
 
-@pytest.mark.asyncio
+@pytest.mark.asyncio(loop_scope="session")
 class TestFetchUrl:
     """Test URL fetching functionality."""
 
-    async def test_fetch_html_page_success(self):
+    async def test_fetch_html_page_success(self, mock_server):
         """Test successful fetch of HTML page."""
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = "<html><body><h1>Test</h1></body></html>"
-        mock_response.headers = {"content-type": "text/html"}
-        
-        with patch('mcp_server_fetch.server.AsyncClient') as mock_client:
-            mock_client.return_value.__aenter__.return_value.get = AsyncMock(return_value=mock_response)
-            
-            content, prefix = await fetch_url(
-                "https://example.com",
-                DEFAULT_USER_AGENT_AUTONOMOUS
-            )
-            
-            assert isinstance(content, str)
-            assert prefix == ""
+        mock_server.respond(200, "<html><body><h1>Test</h1></body></html>", {"content-type": "text/html"})
+
+        content, prefix = await fetch_url(
+            "https://example.com",
+            DEFAULT_USER_AGENT_AUTONOMOUS
+        )
+
+        assert isinstance(content, str)
+        assert prefix == ""
 
-    async def test_fetch_non_html_content(self):
+    async def test_fetch_non_html_content(self, mock_server):
         """Test fetch of non-HTML content (JSON, XML, etc.)."""
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = '{"key": "value"}'
-        mock_response.headers = {"content-type": "application/json"}
-        
-        with patch('mcp_server_fetch.server.AsyncClient') as mock_client:
-            mock_client.return_value.__aenter__.return_value.get = AsyncMock(return_value=mock_response)
-            
-            content, prefix = await fetch_url(
-                "https://api.example.com/data",
-                DEFAULT_USER_AGENT_AUTONOMOUS
-            )
-            
-            assert content == '{"key": "value"}'
-            assert "cannot be simplified" in prefix
+        mock_server.respond(200, '{"key": "value"}', {"content-type": "application/json"})
+
+        content, prefix = await fetch_url(
+            "https://api.example.com/data",
+            DEFAULT_USER_AGENT_AUTONOMOUS
+        )
 
-    async def test_fetch_with_force_raw(self):
+        assert content == '{"key": "value"}'
+        assert "cannot be simplified" in prefix
+
+    async def test_fetch_with_force_raw(self, mock_server):
         """Test fetch with force_raw flag."""
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = "<html><body>Content</body></html>"
-        mock_response.headers = {"content-type": "text/html"}
-        
-        with patch('mcp_server_fetch.server.AsyncClient') as mock_client:
-            mock_client.return_value.__aenter__.return_value.get = AsyncMock(return_value=mock_response)
-            
-            content, prefix = await fetch_url(
-                "https://example.com",
-                DEFAULT_USER_AGENT_AUTONOMOUS,
-                force_raw=True
-            )
-            
-            # Should return raw HTML
-            assert "<html>" in content
-            assert "cannot be simplified" in prefix
+        mock_server.respond(200, "<html><body>Content</body></html>", {"content-type": "text/html"})
 
-    async def test_fetch_404_error(self):
-        """Test fetch when URL returns 404."""
-        mock_response = Mock()
-        mock_response.status_code = 404
-        
-        with patch('mcp_server_fetch.server.AsyncClient') as mock_client:
-            mock_client.return_value.__aenter__.return_value.get = AsyncMock(return_value=mock_response)
-            
-            with pytest.raises(McpError) as exc_info:
-                await fetch_url(
-                    "https://example.com/notfound",
-                    DEFAULT_USER_AGENT_AUTONOMOUS
-                )
-            
-            assert exc_info.value.error.code == INTERNAL_ERROR
-            assert "404" in exc_info.value.error.message
+        content, prefix = await fetch_url(
+            "https://example.com",
+            DEFAULT_USER_AGENT_AUTONOMOUS,
+            force_raw=True
+        )
 
-    async def test_fetch_500_error(self):
-        """Test fetch when server returns 500."""
-        mock_response = Mock()
-        mock_response.status_code = 500
-        
-        with patch('mcp_server_fetch.server.AsyncClient') as mock_client:
-            mock_client.return_value.__aenter__.return_value.get = AsyncMock(return_value=mock_response)
-            
-            with pytest.raises(McpError) as exc_info:
-                await fetch_url(
-                    "https://example.com",
-                    DEFAULT_USER_AGENT_AUTONOMOUS
-                )
-            
-            assert exc_info.value.error.code == INTERNAL_ERROR
-            assert "500" in exc_info.value.error.message
+        # Should return raw HTML
+        assert "<html>" in content
+        assert "cannot be simplified" in prefix
 
-    async def test_fetch_connection_timeout(self):
-        """Test fetch with connection timeout."""
-        from httpx import TimeoutException
-        
-        with patch('mcp_server_fetch.server.AsyncClient') as mock_client:
-            mock_client.return_value.__aenter__.return_value.get = AsyncMock(
-                side_effect=TimeoutException("Timeout")
-            )
-            
-            with pytest.raises(McpError) as exc_info:
-                await fetch_url(
-                    "https://slow-example.com",
-                    DEFAULT_USER_AGENT_AUTONOMOUS
-                )
-            
-            assert exc_info.value.error.code == INTERNAL_ERROR
+    async def test_fetch_html_with_charset_in_content_type(self, mock_server):
+        """Test content-type parameters don't stop HTML from being simplified."""
+        mock_server.respond(200, "<body><h2>Heading</h2><p>Text</p></body>", {"content-type": "Text/HTML; charset=utf-8"})
 
-    async def test_fetch_with_redirects(self):
-        """Test fetch follows redirects."""
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = "<html><body>Redirected content</body></html>"
-        mock_response.headers = {"content-type": "text/html"}
-        
-        with patch('mcp_server_fetch.server.AsyncClient') as mock_client:
-            mock_instance = mock_client.return_value.__aenter__.return_value
-            mock_instance.get = AsyncMock(return_value=mock_response)
-            
+        content, prefix = await fetch_url(
+            "https://example.com",
+            DEFAULT_USER_AGENT_AUTONOMOUS
+        )
+
+        assert prefix == ""
+        assert "<body>" not in content
+
+    async def test_fetch_xhtml_is_simplified(self, mock_server):
+        """Test XHTML responses are treated as HTML."""
+        mock_server.respond(200, "<body><h2>Heading</h2><p>Text</p></body>", {"content-type": "application/xhtml+xml"})
+
+        content, prefix = await fetch_url(
+            "https://example.com",
+            DEFAULT_USER_AGENT_AUTONOMOUS
+        )
+
+        assert prefix == ""
+        assert "<body>" not in content
+
+    async def test_fetch_404_error(self, mock_server):
+        """Test fetch when URL returns 404."""
+        mock_server.respond(404)
+
+        with pytest.raises(McpError) as exc_info:
             await fetch_url(
-                "https://example.com/redirect",
+                "https://example.com/notfound",
                 DEFAULT_USER_AGENT_AUTONOMOUS
             )
-            
-            # Verify follow_redirects was set to True
-            call_kwargs = mock_instance.get.call_args.kwargs
-            assert call_kwargs.get('follow_redirects')
 
-    async def test_fetch_with_custom_timeout(self):
-        """Test fetch uses correct timeout."""
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = "Content"
-        mock_response.headers = {"content-type": "text/plain"}
-        
-        with patch('mcp_server_fetch.server.AsyncClient') as mock_client:
-            mock_instance = mock_client.return_value.__aenter__.return_value
-            mock_instance.get = AsyncMock(return_value=mock_response)
-            
+        assert exc_info.value.error.code == INTERNAL_ERROR
+        assert "404" in exc_info.value.error.message
+
+    async def test_fetch_500_error(self, mock_server):
+        """Test fetch when server returns 500."""
+        mock_server.respond(500)
+
+        with pytest.raises(McpError) as exc_info:
             await fetch_url(
                 "https://example.com",
                 DEFAULT_USER_AGENT_AUTONOMOUS
             )
-            
-            # Verify timeout was set
-            call_kwargs = mock_instance.get.call_args.kwargs
-            assert call_kwargs.get('timeout') == 30
 
-    async def test_fetch_with_proxy(self):
-        """Test fetch with proxy configuration."""
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = "Content"
-        mock_response.headers = {"content-type": "text/plain"}
-        
-        with patch('mcp_server_fetch.server.AsyncClient') as mock_client:
-            mock_instance = mock_client.return_value.__aenter__.return_value
-            mock_instance.get = AsyncMock(return_value=mock_response)
-            
+        assert exc_info.value.error.code == INTERNAL_ERROR
+        assert "500" in exc_info.value.error.message
+
+    async def test_fetch_connection_timeout(self, mock_server):
+        """Test fetch with connection timeout."""
+        def time_out(request):
+            raise TimeoutException("Timeout", request=request)
+
+        mock_server.route(time_out)
+
+        with pytest.raises(McpError) as exc_info:
             await fetch_url(
-                "https://example.com",
-                DEFAULT_USER_AGENT_AUTONOMOUS,
-                proxy_url="http://proxy.example.com:8080"
+                "https://slow-example.com",
+                DEFAULT_USER_AGENT_AUTONOMOUS
             )
-            
-            # Verify proxy was passed to client
-            mock_client.assert_called_with(proxies="http://proxy.example.com:8080")
 
+        assert exc_info.value.error.code == INTERNAL_ERROR
 
-class TestFetchModel:
-    """Test the Fetch pydantic model."""
+    async def test_fetch_with_redirects(self, mock_server):
+        """Test fetch follows redirects."""
+        def redirect(request):
+            if request.url.path == "/redirect":
+                return httpx.Response(302, headers={"location": "https://example.com/final"})
+            return httpx.Response(200, text="Redirected content", headers={"content-type": "text/plain"})
+
+        mock_server.route(redirect)
 
-    def test_fetch_model_valid(self):
-        """Test Fetch model with valid data."""
-        fetch = Fetch(
-            url="https://example.com",
-            max_length=5000,
-            start_index=0,
-            raw=False
+        content, _ = await fetch_url(
+            "https://example.com/redirect",
+            DEFAULT_USER_AGENT_AUTONOMOUS
         )
-        
-        assert str(fetch.url) == "https://example.com/"
-        assert fetch.max_length == 5000
-        assert fetch.start_index == 0
-        assert not fetch.raw
-
-    def test_fetch_model_defaults(self):
-        """Test Fetch model default values."""
-        fetch = Fetch(url="https://example.com")
-        
-        assert fetch.max_length == 5000
-        assert fetch.start_index == 0
-        assert not fetch.raw
-
-    def test_fetch_model_custom_values(self):
-        """Test Fetch model with custom values."""
-        fetch = Fetch(
-            url="https://example.com/page",
-            max_length=10000,
-            start_index=100,
-            raw=True
+
+        # Verify the redirect was followed
+        assert content == "Redirected content"
+        assert str(mock_server.requests[-1].url) == "https://example.com/final"
+
+    async def test_fetch_skips_cached_permanent_redirect(self, mock_server):
+        """Test a URL that redirected permanently is fetched from its final location next time."""
+        def redirect(request):
+            if request.url.path == "/old":
+                return httpx.Response(301, headers={"location": "https://example.com/new"})
+            return httpx.Response(200, text="Moved content", headers={"content-type": "text/plain"})
+
+        mock_server.route(redirect)
+
+        await fetch_url("https://example.com/old", DEFAULT_USER_AGENT_AUTONOMOUS)
+        content, _ = await fetch_url("https://example.com/old", DEFAULT_USER_AGENT_AUTONOMOUS)
+
+        assert content == "Moved content"
+        assert [str(r.url) for r in mock_server.requests] == [
+            "https://example.com/old",
+            "https://example.com/new",
+            "https://example.com/new",
+        ]
+
+    async def test_fetch_drops_failing_cached_redirect(self, mock_server):
+        """Test a cached redirect target that starts failing is forgotten and the URL retried."""
+        moved = True
+
+        def redirect(request):
+            if request.url.path == "/old" and moved:
+                return httpx.Response(301, headers={"location": "https://example.com/new"})
+            if request.url.path == "/new" and not moved:
+                return httpx.Response(410)
+            return httpx.Response(200, text="Content", headers={"content-type": "text/plain"})
+
+        mock_server.route(redirect)
+
+        await fetch_url("https://example.com/old", DEFAULT_USER_AGENT_AUTONOMOUS)
+        moved = False
+        for _ in range(2):
+            content, _ = await fetch_url("https://example.com/old", DEFAULT_USER_AGENT_AUTONOMOUS)
+            assert content == "Content"
+
+        assert [str(r.url) for r in mock_server.requests] == [
+            "https://example.com/old",
+            "https://example.com/new",
+            "https://example.com/new",
+            "https://example.com/old",
+            "https://example.com/old",
+        ]
+
+    async def test_fetch_cached_redirect_expires(self, mock_server, monkeypatch):
+        """Test a cached redirect is followed from the original URL again once it expires."""
+        def redirect(request):
+            if request.url.path == "/old":
+                return httpx.Response(301, headers={"location": "https://example.com/new"})
+            return httpx.Response(200, text="Moved content", headers={"content-type": "text/plain"})
+
+        mock_server.route(redirect)
+        monkeypatch.setattr('mcp_server_fetch.server.REDIRECT_CACHE_TTL', 0)
+
+        await fetch_url("https://example.com/old", DEFAULT_USER_AGENT_AUTONOMOUS)
+        await fetch_url("https://example.com/old", DEFAULT_USER_AGENT_AUTONOMOUS)
+
+        assert len(mock_server.requests) == 4
+
+    async def test_fetch_does_not_cache_temporary_redirect(self, mock_server):
+        """Test a temporary redirect is followed again on every fetch."""
+        def redirect(request):
+            if request.url.path == "/redirect":
+                return httpx.Response(302, headers={"location": "https://example.com/final"})
+            return httpx.Response(200, text="Redirected content", headers={"content-type": "text/plain"})
+
+        mock_server.route(redirect)
+
+        await fetch_url("https://example.com/redirect", DEFAULT_USER_AGENT_AUTONOMOUS)
+        await fetch_url("https://example.com/redirect", DEFAULT_USER_AGENT_AUTONOMOUS)
+
+        assert len(mock_server.requests) == 4
+
+    async def test_fetch_with_custom_timeout(self, mock_server):
+        """Test fetch uses correct timeout."""
+        mock_server.respond(200, "Content", {"content-type": "text/plain"})
+
+        await fetch_url(
+            "https://example.com",
+            DEFAULT_USER_AGENT_AUTONOMOUS
         )
-        
-        assert fetch.max_length == 10000
-        assert fetch.start_index == 100
-        assert fetch.raw
 
-    def test_fetch_model_invalid_max_length_zero(self):
-        """Test Fetch model rejects zero max_length."""
-        with pytest.raises(ValueError):
-            Fetch(url="https://example.com", max_length=0)
+        # Verify timeout was set
+        assert mock_server.requests[0].extensions["timeout"]["read"] == 30
 
-    def test_fetch_model_invalid_max_length_negative(self):
-        """Test Fetch model rejects negative max_length."""
-        with pytest.raises(ValueError):
-            Fetch(url="https://example.com", max_length=-100)
+    async def test_fetch_with_proxy(self, mock_server):
+        """Test fetch with proxy configuration."""
+        mock_server.respond(200, "Content", {"content-type": "text/plain"})
 
-    def test_fetch_model_invalid_max_length_too_large(self):
-        """Test Fetch model rejects max_length >= 1000000."""
-        with pytest.raises(ValueError):
-            Fetch(url="https://example.com", max_length=1000000)
+        await fetch_url(
+            "https://example.com",
+            DEFAULT_USER_AGENT_AUTONOMOUS,
+            proxy_url="http://proxy.example.com:8080"
+        )
+
+        # Verify proxy was passed to client
+        assert mock_server.proxy_urls == ["http://proxy.example.com:8080"]
+
+    async def test_fetch_stops_reading_at_size_cap(self, mock_server, monkeypatch):
+        """Test the body is no longer read once MAX_RESPONSE_BYTES is reached."""
+        monkeypatch.setattr('mcp_server_fetch.server.MAX_RESPONSE_BYTES', 8)
+        chunks_read = []
 
-    def test_fetch_model_invalid_start_index_negative(self):
-        """Test Fetch model rejects negative start_index."""
+        async def endless_body():
+            while True:
+                chunks_read.append(b"abcd")
+                yield b"abcd"
+
+        mock_server.route(lambda request: httpx.Response(
+            200, content=endless_body(), headers={"content-type": "text/plain"}
+        ))
+
+        content, prefix = await fetch_url(
+            "https://example.com/huge",
+            DEFAULT_USER_AGENT_AUTONOMOUS
+        )
+
+        assert content == "abcdabcd"
+        assert len(chunks_read) == 2
+        assert prefix.startswith(TRUNCATED_RESPONSE_NOTICE.format(max_bytes=8))
+
+    async def test_fetch_decodes_with_response_encoding(self, mock_server):
+        """Test the body is decoded using the response's declared encoding."""
+        mock_server.route(lambda request: httpx.Response(
+            200, content="café".encode("latin-1"), headers={"content-type": "text/plain; charset=latin-1"}
+        ))
+
+        content, _ = await fetch_url(
+            "https://example.com",
+            DEFAULT_USER_AGENT_AUTONOMOUS
+        )
+
+        assert content == "café"
+
+
+@pytest.mark.asyncio(loop_scope="session")
+class TestConnectionPool:
+    """Test the connection pools shared between fetches and the per-fetch clients using them."""
+
+    async def test_transport_reused_for_same_proxy(self):
+        """Test repeated lookups return the same connection pool."""
+        try:
+            assert _get_transport() is _get_transport()
+        finally:
+            await close_transports()
+
+    async def test_transport_per_proxy(self):
+        """Test each proxy setting gets its own connection pool."""
+        try:
+            assert _get_transport() is not _get_transport("http://proxy.example.com:8080")
+        finally:
+            await close_transports()
+
+    async def test_transport_negotiates_http2(self):
+        """Test the pool offers HTTP/2 so requests to one host can share a connection."""
+        with patch('mcp_server_fetch.server.AsyncHTTPTransport') as mock_transport, \
+                patch.dict('mcp_server_fetch.server._transports', clear=True):
+            _get_transport()
+
+        assert mock_transport.call_args.kwargs["http2"] is True
+
+    async def test_closed_transports_are_replaced(self):
+        """Test a new pool is created after the shared ones are closed."""
+        transport = _get_transport()
+        await close_transports()
+
+        replacement = _get_transport()
+        try:
+            assert replacement is not transport
+        finally:
+            await close_transports()
+
+    async def test_client_caps_redirects(self):
+        """Test the per-fetch client gives up on long redirect chains."""
+        with patch('mcp_server_fetch.server.AsyncClient') as mock_async_client, \
+                patch('mcp_server_fetch.server.AsyncHTTPTransport'), \
+                patch.dict('mcp_server_fetch.server._transports', clear=True):
+            _get_client()
+
+        assert mock_async_client.call_args.kwargs["max_redirects"] == MAX_REDIRECTS
+
+    async def test_closing_client_keeps_pool_open(self):
+        """Test closing a per-fetch client doesn't close the shared pool."""
+        pool = ClosableMockTransport(lambda request: httpx.Response(200))
+
+        with patch('mcp_server_fetch.server._get_transport', return_value=pool):
+            async with _get_client() as client:
+                await client.get("https://example.com")
+
+        assert not pool.closed
+
+    async def test_client_does_not_keep_cookies(self):
+        """Test cookies set by one fetch are not sent with the next one."""
+        requests = []
+
+        def set_cookie(request):
+            requests.append(request)
+            return httpx.Response(200, text="Content", headers={"content-type": "text/plain", "set-cookie": "meter=1; Path=/"})
+
+        with patch('mcp_server_fetch.server._get_transport', return_value=httpx.MockTransport(set_cookie)):
+            await fetch_url("https://example.com/a", DEFAULT_USER_AGENT_AUTONOMOUS)
+            await fetch_url("https://example.com/b", DEFAULT_USER_AGENT_MANUAL)
+
+        assert "cookie" not in requests[1].headers
+
+    async def test_client_keeps_cookies_within_redirects(self):
+        """Test a cookie set during a fetch's redirect chain is sent on the rest of that chain."""
+        def cookie_gate(request):
+            if request.url.path == "/setcookie":
+                return httpx.Response(302, headers={"location": "/article", "set-cookie": "gate=ok; Path=/"})
+            if "gate=ok" in request.headers.get("cookie", ""):
+                return httpx.Response(200, text="Article", headers={"content-type": "text/plain"})
+            return httpx.Response(302, headers={"location": "/setcookie"})
+
+        with patch('mcp_server_fetch.server._get_transport', return_value=httpx.MockTransport(cookie_gate)):
+            content, _ = await fetch_url("https://example.com/article", DEFAULT_USER_AGENT_AUTONOMOUS)
+
+        assert content == "Article"
+
+
+class TestFetchModel:
+    """Test the Fetch pydantic model."""
+
+    @pytest.mark.parametrize(
+        "kwargs, expected_url, expected",
+        [
+            (
+                {"url": "https://example.com", "max_length": 5000, "start_index": 0, "raw": False},
+                "https://example.com/",
+                {"max_length": 5000, "start_index": 0, "raw": False},
+            ),
+            (
+                {"url": "https://example.com"},
+                "https://example.com/",
+                {"max_length": 5000, "start_index": 0, "raw": False},
+            ),
+            (
+                {"url": "https://example.com/page", "max_length": 10000, "start_index": 100, "raw": True},
+                "https://example.com/page",
+                {"max_length": 10000, "start_index": 100, "raw": True},
+            ),
+        ],
+        ids=["valid", "defaults", "custom_values"],
+    )
+    def test_fetch_model_accepts_valid_arguments(self, kwargs, expected_url, expected):
+        """Test Fetch model keeps given values and fills in defaults."""
+        fetch = Fetch(**kwargs)
+
+        assert str(fetch.url) == expected_url
+        for field, value in expected.items():
+            assert getattr(fetch, field) == value
+
+    @pytest.mark.parametrize(
+        "kwargs",
+        [
+            {"url": "https://example.com", "max_length": 0},
+            {"url": "https://example.com", "max_length": -100},
+            {"url": "https://example.com", "max_length": 1000000},
+            {"url": "https://example.com", "start_index": -1},
+            {"url": "not a valid url"},
+            {"max_length": 5000},
+        ],
+        ids=[
+            "max_length_zero",
+            "max_length_negative",
+            "max_length_too_large",
+            "start_index_negative",
+            "invalid_url",
+            "missing_url",
+        ],
+    )
+    def test_fetch_model_rejects_invalid_arguments(self, kwargs):
+        """Test Fetch model rejects out-of-range values and bad or missing URLs."""
         with pytest.raises(ValueError):
-            Fetch(url="https://example.com", start_index=-1)
+            Fetch(**kwargs)
 
     def test_fetch_model_valid_url_formats(self):
         """Test Fetch model accepts various URL formats."""
@@ -588,23 +852,29 @@ class TestFetchModel:
             fetch = Fetch(url=url)
             assert fetch.url is not None
 
-    def test_fetch_model_invalid_url(self):
-        """Test Fetch model rejects invalid URLs."""
-        with pytest.raises(ValueError):
-            Fetch(url="not a valid url")
+    def test_cached_fetch_reuses_instance(self):
+        """Test identical parameters return the same validated instance."""
+        first = Fetch._cached(url="https://example.com", max_length=1000)
+        second = Fetch._cached(url="https://example.com", max_length=1000)
+
+        assert first is second
+        assert first.max_length == 1000
+
+    def test_cached_fetch_uses_model_defaults(self):
+        """Test the cached constructor fills in the same defaults as the model."""
+        assert Fetch._cached(url="https://example.com") == Fetch(url="https://example.com")
 
-    def test_fetch_model_missing_url(self):
-        """Test Fetch model requires URL."""
+    def test_cached_fetch_still_validates(self):
+        """Test the cached constructor rejects invalid parameters."""
         with pytest.raises(ValueError):
-            Fetch(max_length=5000)
+            Fetch._cached(url="https://example.com", max_length=0)
 
 
 class TestEdgeCases:
     """Test edge cases and boundary conditions."""
 
-    def test_extract_very_large_html(self):
+    def test_extract_very_large_html(self, large_html):
         """Test extraction from very large HTML document."""
-        large_html = "<html><body>" + ("p" * 100000) + "</body></html>"
         result = extract_content_from_html(large_html)
         
         assert isinstance(result, str)